@@ -1,18 +1,29 @@
 from fastapi import FastAPI, APIRouter, UploadFile, File, HTTPException
+from fastapi.responses import ORJSONResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
 import os
+import asyncio
 import logging
+import warnings
 from pathlib import Path
 from pydantic import BaseModel, Field
 from typing import List, Dict, Any, Optional
 import uuid
 from datetime import datetime, timezone
 import pandas as pd
-import io
+import numpy as np
+from pandas.tseries.api import guess_datetime_format
+import pyarrow as pa
+import pyarrow.csv as pa_csv
 import json
+import re
+import csv
 from collections import Counter
+from async_lru import alru_cache
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -23,7 +34,7 @@ client = AsyncIOMotorClient(mongo_url)
 db = client[os.environ['DB_NAME']]
 
 # Create the main app without a prefix
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -34,6 +45,7 @@ class ProcessingLog(BaseModel):
     filename: str
     status: str  # 'processing', 'completed', 'failed'
     records_processed: int = 0
+    records_existing: int = 0
     records_failed: int = 0
     errors: List[str] = []
     timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
@@ -65,59 +77,127 @@ class ProductInsight(BaseModel):
     avg_price: float
     orders_count: int
 
+class PartialStoreError(Exception):
+    """Raised when storing a dataframe failed after some of its records were written"""
+    def __init__(self, inserted, existing, cause):
+        super().__init__(f"Error storing data: {str(cause)}")
+        self.inserted = inserted
+        self.existing = existing
+
 # Utility functions
+MAX_UPLOAD_SIZE = 500 * 1024 * 1024  # largest accepted CSV upload, in bytes
+CSV_BLOCK_SIZE = 8 << 20  # bytes of CSV parsed per batch
+INSERT_BATCH_SIZE = 10_000  # operations per bulk_write call
+RECORD_KEY = ('order_id', 'product_id')  # identifies an order line across uploads
+DATE_FORMAT_SAMPLE_SIZE = 50  # order dates sampled to infer the date format
+ANALYTICS_CACHE_TTL = 30  # seconds an analytics overview is reused
+
+# Common column mappings, keyed by lowercased names with spaces/underscores removed
+COLUMN_MAPPINGS = {
+    'invoiceno': 'order_id',
+    'invoice': 'order_id',
+    'orderid': 'order_id',
+    'stockcode': 'product_id',
+    'productid': 'product_id',
+    'sku': 'product_id',
+    'description': 'product_name',
+    'productname': 'product_name',
+    'product': 'product_name',
+    'quantity': 'quantity',
+    'qty': 'quantity',
+    'unitprice': 'unit_price',
+    'price': 'unit_price',
+    'customerid': 'customer_id',
+    'customer': 'customer_id',
+    'invoicedate': 'order_date',
+    'date': 'order_date',
+    'orderdate': 'order_date',
+    'country': 'country'
+}
+COLUMN_NAME_STRIP = str.maketrans('', '', ' _')
+COUNTED_ERROR = re.compile(r'^(Removed|Skipped) (\d+) (.+)$')
+CATEGORICAL_COLUMNS = ('order_id', 'product_id', 'customer_id', 'country')
+
+def read_csv_batches(source):
+    """Yield (DataFrame, malformed rows skipped) for successive blocks of a CSV file object"""
+    header = source.readline()
+    if not header:
+        return
+    source.seek(0)
+    
+    # Read every column as string; standardize_schema coerces the types it needs,
+    # so a later block can't contradict what was inferred from the first one
+    column_names = next(csv.reader([header.decode('utf-8-sig')]))
+    
+    # Skip rows with the wrong number of fields instead of failing the upload
+    skipped_rows = []
+    def skip_invalid_row(row):
+        skipped_rows.append(row.number)
+        return 'skip'
+    
+    reader = pa_csv.open_csv(
+        source,
+        read_options=pa_csv.ReadOptions(use_threads=True, block_size=CSV_BLOCK_SIZE),
+        parse_options=pa_csv.ParseOptions(invalid_row_handler=skip_invalid_row),
+        convert_options=pa_csv.ConvertOptions(
+            column_types={name: pa.string() for name in column_names},
+            strings_can_be_null=True
+        )
+    )
+    reported = 0
+    for batch in reader:
+        skipped = len(skipped_rows) - reported
+        reported += skipped
+        yield batch.to_pandas(types_mapper=pd.ArrowDtype), skipped
+
+def infer_date_format(values):
+    """Guess a date format that parses every sampled value, or None to let pandas infer"""
+    # Day-first guesses warn that dayfirst wasn't passed; each guess is checked below
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', UserWarning)
+        candidates = dict.fromkeys(guess_datetime_format(value) for value in values)
+    candidates.pop(None, None)
+    for date_format in candidates:
+        if pd.to_datetime(pd.Series(values), format=date_format, errors='coerce').notna().all():
+            return date_format
+    return None
+
 def clean_dataframe(df):
     """Clean and standardize the dataframe"""
     errors = []
-    original_count = len(df)
     
-    # Remove duplicates
-    df = df.drop_duplicates()
-    duplicates_removed = original_count - len(df)
+    # Drop rows with missing values first, so an incomplete row can't shadow
+    # a complete duplicate of the same order line
+    missing = df.isnull().any(axis=1)
+    df = df.loc[~missing]
+    
+    # Remove duplicates, comparing only the order line key when it is mapped
+    subset = list(RECORD_KEY) if all(key in df.columns for key in RECORD_KEY) else None
+    duplicated = df.duplicated(subset=subset, keep='first')
+    df = df.loc[~duplicated]
+    
+    duplicates_removed = int(duplicated.sum())
     if duplicates_removed > 0:
         errors.append(f"Removed {duplicates_removed} duplicate records")
     
-    # Handle missing values
-    missing_before = df.isnull().sum().sum()
-    df = df.dropna()
-    missing_removed = missing_before - df.isnull().sum().sum()
+    missing_removed = int(missing.sum())
     if missing_removed > 0:
-        errors.append(f"Removed {len(df)} records with missing values")
+        errors.append(f"Removed {missing_removed} records with missing values")
     
     return df, errors
 
-def standardize_schema(df):
-    """Standardize column names and data types"""
+def standardize_schema(df, date_format=None):
+    """Standardize column names and data types, returning the date format used"""
     errors = []
     
-    # Common column mappings
-    column_mappings = {
-        'invoiceno': 'order_id',
-        'invoice': 'order_id',
-        'orderid': 'order_id',
-        'stockcode': 'product_id',
-        'productid': 'product_id',
-        'sku': 'product_id',
-        'description': 'product_name',
-        'productname': 'product_name',
-        'product': 'product_name',
-        'quantity': 'quantity',
-        'qty': 'quantity',
-        'unitprice': 'unit_price',
-        'price': 'unit_price',
-        'customerid': 'customer_id',
-        'customer': 'customer_id',
-        'invoicedate': 'order_date',
-        'date': 'order_date',
-        'orderdate': 'order_date',
-        'country': 'country'
-    }
-    
-    # Normalize column names
-    df.columns = df.columns.str.lower().str.replace(' ', '').str.replace('_', '')
+    # Normalize column names and map them to the standard schema
+    normalized = [column.lower().translate(COLUMN_NAME_STRIP) for column in df.columns]
+    df = df.set_axis([COLUMN_MAPPINGS.get(column, column) for column in normalized], axis=1)
     
-    # Map columns
-    df = df.rename(columns=column_mappings)
+    # Low-cardinality identifier columns are cheaper to hold as categoricals
+    for column in CATEGORICAL_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype('category')
     
     # Ensure required columns exist
     required_columns = ['order_id', 'product_id', 'quantity', 'unit_price']
@@ -125,7 +205,7 @@ def standardize_schema(df):
     
     if missing_columns:
         errors.append(f"Missing required columns: {missing_columns}")
-        return df, errors
+        return df, errors, date_format
     
     # Convert data types
     try:
@@ -134,37 +214,145 @@ def standardize_schema(df):
         
         # Calculate total price if not exists
         if 'total_price' not in df.columns:
-            df['total_price'] = df['quantity'] * df['unit_price']
+            quantity = df['quantity'].to_numpy(dtype=np.float64, na_value=np.nan)
+            unit_price = df['unit_price'].to_numpy(dtype=np.float64, na_value=np.nan)
+            df['total_price'] = np.multiply(quantity, unit_price)
         
         # Parse dates
         if 'order_date' in df.columns:
-            df['order_date'] = pd.to_datetime(df['order_date'], errors='coerce')
+            dates = df['order_date']
+            if date_format is None:
+                sample = dates.dropna().iloc[:DATE_FORMAT_SAMPLE_SIZE].tolist()
+                date_format = infer_date_format(sample)
+            parsed = pd.to_datetime(dates, format=date_format, errors='coerce', cache=True)
+            
+            # The upload's format may not fit every value; retry those with a
+            # format inferred from them alone, or pandas' own inference
+            failed = parsed.isna() & dates.notna()
+            if failed.any() and date_format is not None:
+                retry_values = dates[failed]
+                retry_format = infer_date_format(retry_values.iloc[:DATE_FORMAT_SAMPLE_SIZE].tolist())
+                with warnings.catch_warnings():
+                    warnings.simplefilter('ignore', UserWarning)
+                    parsed[failed] = pd.to_datetime(retry_values, format=retry_format, errors='coerce', cache=True)
+                failed = parsed.isna() & dates.notna()
+            
+            df['order_date'] = parsed
+            unparseable = int(failed.sum())
+            if unparseable > 0:
+                df = df.loc[~failed]
+                errors.append(f"Removed {unparseable} records with unparseable order dates")
         
     except Exception as e:
         errors.append(f"Error converting data types: {str(e)}")
     
-    return df, errors
+    return df, errors, date_format
+
+class UploadProgress:
+    """State carried from one CSV batch of an upload to the next"""
+    def __init__(self):
+        self.date_format = None  # inferred from the first batch with dates, then reused
+        self.seen_keys = np.empty(0, dtype=np.uint64)  # sorted hashes of stored order lines
+
+def drop_seen_keys(df, progress):
+    """Drop order lines already seen in an earlier batch of the same upload"""
+    keys = pd.util.hash_pandas_object(df[list(RECORD_KEY)], index=False).to_numpy()
+    seen = np.isin(keys, progress.seen_keys)
+    progress.seen_keys = np.union1d(progress.seen_keys, keys)
+    return df.loc[~seen], int(seen.sum())
+
+def process_next_batch(batches, progress):
+    """Parse, clean and standardize the next CSV batch, or return None when exhausted"""
+    batch = next(batches, None)
+    if batch is None:
+        return None
+    
+    df, malformed_count = batch
+    original_count = len(df) + malformed_count
+    
+    # Standardize schema first so duplicates can be matched on the order line key
+    df, schema_errors, progress.date_format = standardize_schema(df, progress.date_format)
+    
+    # Clean data
+    df, cleaning_errors = clean_dataframe(df)
+    
+    # Duplicates split across batches would otherwise be reported as already stored
+    if all(key in df.columns for key in RECORD_KEY):
+        df, repeated_count = drop_seen_keys(df, progress)
+        if repeated_count > 0:
+            cleaning_errors.append(f"Removed {repeated_count} duplicate records")
+    
+    if malformed_count > 0:
+        cleaning_errors.append(f"Skipped {malformed_count} malformed records")
+    
+    return df, original_count, cleaning_errors + schema_errors
+
+def summarize_errors(errors):
+    """Merge per-batch messages, summing the counts of repeated 'Removed/Skipped N ...' messages"""
+    counts = Counter()
+    for error in errors:
+        match = COUNTED_ERROR.match(error)
+        if match:
+            verb, count, subject = match.groups()
+            counts[f"{verb} {{}} {subject}"] += int(count)
+        else:
+            counts[error] += 0
+    return [error.format(count) if count else error for error, count in counts.items()]
+
+def build_upserts(df, filename):
+    """Convert a processed dataframe into idempotent MongoDB upserts"""
+    # Convert through Arrow, which builds the row dicts in C++ and turns
+    # NaN/NaT into None and timestamps into datetimes (stored as BSON Dates)
+    records = pa.Table.from_pandas(df, preserve_index=False).to_pylist()
+    
+    # Add metadata; _id is left for MongoDB to assign
+    processed_at = datetime.now(timezone.utc)
+    for record in records:
+        record['source_file'] = filename
+        record['processed_at'] = processed_at
+    
+    # Key each document on its order line so re-uploads don't duplicate it
+    return [
+        UpdateOne({key: record[key] for key in RECORD_KEY}, {'$setOnInsert': record}, upsert=True)
+        for record in records
+    ]
 
 async def store_processed_data(df, filename):
-    """Store processed data in MongoDB"""
+    """Store processed data in MongoDB, returning (new records, records already stored)"""
     try:
-        # Convert DataFrame to dict records
-        records = df.to_dict('records')
+        loop = asyncio.get_running_loop()
+        operations = await loop.run_in_executor(None, build_upserts, df, filename)
         
-        # Add metadata
-        for record in records:
-            record['_id'] = str(uuid.uuid4())
-            record['source_file'] = filename
-            record['processed_at'] = datetime.now(timezone.utc)
-            
-            # Convert pandas timestamps to ISO strings
-            if 'order_date' in record and pd.notna(record['order_date']):
-                if hasattr(record['order_date'], 'isoformat'):
-                    record['order_date'] = record['order_date'].isoformat()
+        # Write to MongoDB as concurrent unordered batches
+        batches = [
+            operations[i:i + INSERT_BATCH_SIZE]
+            for i in range(0, len(operations), INSERT_BATCH_SIZE)
+        ]
+        results = await asyncio.gather(*(
+            db.ecommerce_data.bulk_write(batch, ordered=False, bypass_document_validation=True)
+            for batch in batches
+        ), return_exceptions=True)
+        compute_analytics_overview.cache_clear()
+        
+        # Count every write that landed, including those from failed batches;
+        # upserts that matched an existing order line left it unchanged
+        inserted = existing = 0
+        failure = None
+        for result in results:
+            if isinstance(result, BulkWriteError):
+                inserted += result.details.get('nUpserted', 0)
+                existing += result.details.get('nMatched', 0)
+            if isinstance(result, BaseException):
+                failure = failure or result
+            else:
+                inserted += result.upserted_count
+                existing += result.matched_count
         
-        # Insert into MongoDB
-        await db.ecommerce_data.insert_many(records)
-        return len(records)
+        if failure is not None:
+            raise PartialStoreError(inserted, existing, failure)
+        return inserted, existing
+    except PartialStoreError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error storing data: {str(e)}")
 
@@ -179,6 +367,17 @@ async def upload_file(file: UploadFile = File(...)):
     if not file.filename.endswith('.csv'):
         raise HTTPException(status_code=400, detail="Only CSV files are supported")
     
+    # Reject oversized uploads before parsing anything
+    upload_size = file.size
+    if upload_size is None:
+        upload_size = file.file.seek(0, os.SEEK_END)
+        file.file.seek(0)
+    if upload_size > MAX_UPLOAD_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"File too large; the limit is {MAX_UPLOAD_SIZE // (1024 * 1024)} MB"
+        )
+    
     # Create processing log
     log_entry = ProcessingLog(
         filename=file.filename,
@@ -186,30 +385,35 @@ async def upload_file(file: UploadFile = File(...)):
     )
     
     start_time = datetime.now(timezone.utc)
+    original_count = 0
+    records_stored = 0
+    records_existing = 0
+    all_errors = []
     
     try:
-        # Read file content
-        content = await file.read()
-        df = pd.read_csv(io.StringIO(content.decode('utf-8')))
-        
-        original_count = len(df)
-        
-        # Clean data
-        df, cleaning_errors = clean_dataframe(df)
-        
-        # Standardize schema
-        df, schema_errors = standardize_schema(df)
-        
-        all_errors = cleaning_errors + schema_errors
+        # Process the spooled upload one block at a time, off the event loop
+        loop = asyncio.get_running_loop()
+        batches = read_csv_batches(file.file)
+        progress = UploadProgress()
+        while (batch := await loop.run_in_executor(None, process_next_batch, batches, progress)) is not None:
+            df, batch_count, batch_errors = batch
+            original_count += batch_count
+            all_errors.extend(batch_errors)
+            
+            # Store processed data; rows can only be keyed once the key columns are mapped
+            if len(df) > 0 and all(key in df.columns for key in RECORD_KEY):
+                inserted, existing = await store_processed_data(df, file.filename)
+                records_stored += inserted
+                records_existing += existing
         
-        # Store processed data
-        records_stored = await store_processed_data(df, file.filename)
+        all_errors = summarize_errors(all_errors)
         
         # Update log
         processing_time = (datetime.now(timezone.utc) - start_time).total_seconds()
         log_entry.status = 'completed'
         log_entry.records_processed = records_stored
-        log_entry.records_failed = original_count - records_stored
+        log_entry.records_existing = records_existing
+        log_entry.records_failed = original_count - records_stored - records_existing
         log_entry.errors = all_errors
         log_entry.processing_time = processing_time
         
@@ -219,138 +423,156 @@ async def upload_file(file: UploadFile = File(...)):
         return {
             "message": "File processed successfully",
             "records_processed": records_stored,
-            "records_failed": original_count - records_stored,
+            "records_existing": records_existing,
+            "records_failed": original_count - records_stored - records_existing,
             "errors": all_errors,
             "processing_time": processing_time
         }
         
     except Exception as e:
-        # Log error
+        # Log error; batches stored before the failure stay in the database
+        if isinstance(e, PartialStoreError):
+            records_stored += e.inserted
+            records_existing += e.existing
+        
+        error = str(e)
+        if records_stored > 0:
+            error = f"{error} ({records_stored} records were stored before the failure)"
+        
         processing_time = (datetime.now(timezone.utc) - start_time).total_seconds()
         log_entry.status = 'failed'
-        log_entry.errors = [str(e)]
+        log_entry.records_processed = records_stored
+        log_entry.records_existing = records_existing
+        log_entry.records_failed = original_count - records_stored - records_existing
+        log_entry.errors = summarize_errors(all_errors) + [error]
         log_entry.processing_time = processing_time
         
         await db.processing_logs.insert_one(log_entry.dict())
         
-        raise HTTPException(status_code=500, detail=f"Error processing file: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error processing file: {error}")
 
-@api_router.get("/analytics/overview")
-async def get_analytics_overview():
-    """Get overall analytics overview"""
-    try:
-        # Get basic stats
-        total_records = await db.ecommerce_data.count_documents({})
-        
-        if total_records == 0:
-            return {
-                "total_records": 0,
-                "message": "No data available. Please upload a CSV file first."
+@alru_cache(maxsize=1, ttl=ANALYTICS_CACHE_TTL)
+async def compute_analytics_overview(record_count):
+    """Build the analytics overview; cached per record count until data changes"""
+    # Compute every section of the overview in a single collection scan
+    pipeline = [
+        {
+            "$facet": {
+                "total": [{"$count": "count"}],
+                "overview": [
+                    {
+                        "$group": {
+                            "_id": None,
+                            "total_revenue": {"$sum": "$total_price"},
+                            "unique_customers": {"$addToSet": "$customer_id"},
+                            "unique_products": {"$addToSet": "$product_id"},
+                            "min_date": {"$min": "$order_date"},
+                            "max_date": {"$max": "$order_date"}
+                        }
+                    }
+                ],
+                "top_products": [
+                    {
+                        "$group": {
+                            "_id": {
+                                "product_id": "$product_id",
+                                "product_name": "$product_name"
+                            },
+                            "total_quantity": {"$sum": "$quantity"},
+                            "total_revenue": {"$sum": "$total_price"},
+                            "order_count": {"$sum": 1}
+                        }
+                    },
+                    {"$sort": {"total_revenue": -1}},
+                    {"$limit": 5}
+                ],
+                "top_customers": [
+                    {
+                        "$group": {
+                            "_id": "$customer_id",
+                            "total_spent": {"$sum": "$total_price"},
+                            "order_count": {"$sum": 1}
+                        }
+                    },
+                    {"$sort": {"total_spent": -1}},
+                    {"$limit": 5}
+                ],
+                "daily_revenue": [
+                    {"$match": {"order_date": {"$type": "date"}}},
+                    {"$project": {"order_date": 1, "total_price": 1}},
+                    {
+                        "$group": {
+                            "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$order_date"}},
+                            "revenue": {"$sum": "$total_price"},
+                            "orders": {"$sum": 1}
+                        }
+                    },
+                    {"$sort": {"_id": 1}},
+                    {"$limit": 30}
+                ]
             }
-        
-        # Aggregate data for analytics
-        pipeline = [
+        }
+    ]
+    
+    result = await db.ecommerce_data.aggregate(pipeline, allowDiskUse=True).to_list(1)
+    facets = result[0]
+    
+    total_records = facets["total"][0]["count"] if facets["total"] else 0
+    
+    if total_records == 0:
+        return {
+            "total_records": 0,
+            "message": "No data available. Please upload a CSV file first."
+        }
+    
+    stats = facets["overview"][0] if facets["overview"] else {}
+    top_products = facets["top_products"]
+    top_customers = facets["top_customers"]
+    daily_revenue = facets["daily_revenue"]
+    
+    return {
+        "total_records": total_records,
+        "total_revenue": stats.get("total_revenue", 0),
+        "unique_customers": len(stats.get("unique_customers", [])),
+        "unique_products": len(stats.get("unique_products", [])),
+        "date_range": {
+            "start": stats.get("min_date", ""),
+            "end": stats.get("max_date", "")
+        },
+        "top_products": [
             {
-                "$group": {
-                    "_id": None,
-                    "total_revenue": {"$sum": "$total_price"},
-                    "unique_customers": {"$addToSet": "$customer_id"},
-                    "unique_products": {"$addToSet": "$product_id"},
-                    "min_date": {"$min": "$order_date"},
-                    "max_date": {"$max": "$order_date"}
-                }
+                "product_id": item["_id"]["product_id"],
+                "product_name": item["_id"]["product_name"],
+                "total_revenue": item["total_revenue"],
+                "total_quantity": item["total_quantity"],
+                "order_count": item["order_count"]
             }
-        ]
-        
-        result = await db.ecommerce_data.aggregate(pipeline).to_list(1)
-        stats = result[0] if result else {}
-        
-        # Get top products
-        top_products_pipeline = [
+            for item in top_products
+        ],
+        "top_customers": [
             {
-                "$group": {
-                    "_id": {
-                        "product_id": "$product_id",
-                        "product_name": "$product_name"
-                    },
-                    "total_quantity": {"$sum": "$quantity"},
-                    "total_revenue": {"$sum": "$total_price"},
-                    "order_count": {"$sum": 1}
-                }
-            },
-            {"$sort": {"total_revenue": -1}},
-            {"$limit": 5}
-        ]
-        
-        top_products = await db.ecommerce_data.aggregate(top_products_pipeline).to_list(5)
-        
-        # Get top customers
-        top_customers_pipeline = [
-            {
-                "$group": {
-                    "_id": "$customer_id",
-                    "total_spent": {"$sum": "$total_price"},
-                    "order_count": {"$sum": 1}
-                }
-            },
-            {"$sort": {"total_spent": -1}},
-            {"$limit": 5}
-        ]
-        
-        top_customers = await db.ecommerce_data.aggregate(top_customers_pipeline).to_list(5)
-        
-        # Get daily revenue
-        daily_revenue_pipeline = [
+                "customer_id": item["_id"],
+                "total_spent": item["total_spent"],
+                "order_count": item["order_count"]
+            }
+            for item in top_customers
+        ],
+        "daily_revenue": [
             {
-                "$group": {
-                    "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": {"$dateFromString": {"dateString": "$order_date"}}}},
-                    "revenue": {"$sum": "$total_price"},
-                    "orders": {"$sum": 1}
-                }
-            },
-            {"$sort": {"_id": 1}},
-            {"$limit": 30}
+                "date": item["_id"],
+                "revenue": item["revenue"],
+                "orders": item["orders"]
+            }
+            for item in daily_revenue
         ]
-        
-        daily_revenue = await db.ecommerce_data.aggregate(daily_revenue_pipeline).to_list(30)
-        
-        return {
-            "total_records": total_records,
-            "total_revenue": stats.get("total_revenue", 0),
-            "unique_customers": len(stats.get("unique_customers", [])),
-            "unique_products": len(stats.get("unique_products", [])),
-            "date_range": {
-                "start": stats.get("min_date", ""),
-                "end": stats.get("max_date", "")
-            },
-            "top_products": [
-                {
-                    "product_id": item["_id"]["product_id"],
-                    "product_name": item["_id"]["product_name"],
-                    "total_revenue": item["total_revenue"],
-                    "total_quantity": item["total_quantity"],
-                    "order_count": item["order_count"]
-                }
-                for item in top_products
-            ],
-            "top_customers": [
-                {
-                    "customer_id": item["_id"],
-                    "total_spent": item["total_spent"],
-                    "order_count": item["order_count"]
-                }
-                for item in top_customers
-            ],
-            "daily_revenue": [
-                {
-                    "date": item["_id"],
-                    "revenue": item["revenue"],
-                    "orders": item["orders"]
-                }
-                for item in daily_revenue
-            ]
-        }
-        
+    }
+
+@api_router.get("/analytics/overview")
+async def get_analytics_overview():
+    """Get overall analytics overview"""
+    try:
+        record_count = await db.ecommerce_data.estimated_document_count()
+        return await compute_analytics_overview(record_count)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching analytics: {str(e)}")
 
@@ -358,8 +580,9 @@ async def get_analytics_overview():
 async def get_processing_logs():
     """Get processing logs"""
     try:
-        logs = await db.processing_logs.find().sort("timestamp", -1).to_list(50)
-        return [ProcessingLog(**log) for log in logs]
+        logs = await db.processing_logs.find({}, {"_id": 0}).sort("timestamp", -1).to_list(50)
+        # Logs were validated when written, so skip re-validating them on every poll
+        return [ProcessingLog.model_construct(**log) for log in logs]
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching logs: {str(e)}")
 
@@ -369,6 +592,7 @@ async def clear_all_data():
     try:
         await db.ecommerce_data.delete_many({})
         await db.processing_logs.delete_many({})
+        compute_analytics_overview.cache_clear()
         return {"message": "All data cleared successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error clearing data: {str(e)}")
@@ -391,6 +615,77 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+async def create_index(keys, **kwargs):
+    """Create an index, logging rather than raising if that isn't possible"""
+    try:
+        await db.ecommerce_data.create_index(keys, **kwargs)
+    except PyMongoError as e:
+        logger.warning(f"Could not create index {keys}: {str(e)}")
+
+async def create_indexes():
+    # Each index is attempted on its own, so existing duplicate order lines
+    # blocking the unique index don't prevent the others being built
+    await create_index([(key, 1) for key in RECORD_KEY], unique=True)
+    # Analytics run inside $facet, which can't use indexes; this one serves
+    # the startup check for order dates still stored as strings
+    await create_index([("order_date", 1)])
+
+async def migrate_order_dates():
+    """Convert order dates stored as ISO strings by earlier versions into BSON Dates"""
+    try:
+        result = await db.ecommerce_data.update_many(
+            {"order_date": {"$type": "string"}},
+            [{"$set": {"order_date": {"$dateFromString": {"dateString": "$order_date", "onError": None}}}}]
+        )
+    except PyMongoError as e:
+        logger.warning(f"Could not migrate string order dates: {str(e)}")
+        return
+    if result.modified_count > 0:
+        logger.info(f"Converted {result.modified_count} string order dates to dates")
+        compute_analytics_overview.cache_clear()
+
+async def migrate_record_keys():
+    """Store identifiers written as numbers by earlier versions as strings and drop duplicate order lines"""
+    try:
+        # Once the unique order line index exists the data is already consistent
+        indexes = await db.ecommerce_data.index_information()
+        for index in indexes.values():
+            if index.get('unique') and [key for key, _ in index['key']] == list(RECORD_KEY):
+                return
+        
+        # Uploads now read identifiers as strings, so numeric ones would never match on re-upload
+        for field in (*RECORD_KEY, 'customer_id'):
+            await db.ecommerce_data.update_many(
+                {field: {"$type": "number"}},
+                [{"$set": {field: {"$toString": f"${field}"}}}]
+            )
+        
+        # Keep the first copy of each order line so the unique index can be built
+        duplicates = db.ecommerce_data.aggregate([
+            {"$group": {"_id": {key: f"${key}" for key in RECORD_KEY}, "ids": {"$push": "$_id"}}},
+            {"$match": {"ids.1": {"$exists": True}}}
+        ], allowDiskUse=True)
+        removed = 0
+        async for group in duplicates:
+            result = await db.ecommerce_data.delete_many({"_id": {"$in": group["ids"][1:]}})
+            removed += result.deleted_count
+    except PyMongoError as e:
+        logger.warning(f"Could not migrate order line keys: {str(e)}")
+        return
+    if removed > 0:
+        logger.info(f"Removed {removed} duplicate order lines")
+    compute_analytics_overview.cache_clear()
+
+async def prepare_database():
+    await migrate_order_dates()
+    await migrate_record_keys()
+    await create_indexes()
+
+@app.on_event("startup")
+async def start_database_preparation():
+    # Run in the background so startup never waits on the database
+    app.state.prepare_task = asyncio.create_task(prepare_database())
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
\ No newline at end of file
@@ -0,0 +1,246 @@
+import asyncio
+import io
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+from fastapi import HTTPException, UploadFile
+from pymongo.errors import BulkWriteError
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+import server
+
+
+def order_batch(rows):
+    """Build a raw CSV batch of (invoice, date) order lines"""
+    return pd.DataFrame({
+        'InvoiceNo': [invoice for invoice, _ in rows],
+        'StockCode': 'P1',
+        'Quantity': '1',
+        'UnitPrice': '1.0',
+        'InvoiceDate': [date for _, date in rows],
+    })
+
+
+class FakeCollection:
+    """In-memory stand-in for the Motor collections used by the upload route"""
+
+    def __init__(self, fail_after=None):
+        self.documents = {}
+        self.fail_after = fail_after
+
+    async def bulk_write(self, operations, **kwargs):
+        upserted = matched = 0
+        for operation in operations:
+            if self.fail_after is not None and upserted + matched == self.fail_after:
+                raise BulkWriteError({'nUpserted': upserted, 'nMatched': matched, 'writeErrors': [{}]})
+            key = tuple(operation._filter.values())
+            if key in self.documents:
+                matched += 1
+            else:
+                self.documents[key] = operation._doc['$setOnInsert']
+                upserted += 1
+        return SimpleNamespace(upserted_count=upserted, matched_count=matched)
+
+    async def insert_one(self, document):
+        self.documents[len(self.documents)] = document
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    db = SimpleNamespace(ecommerce_data=FakeCollection(), processing_logs=FakeCollection())
+    monkeypatch.setattr(server, 'db', db)
+    return db
+
+
+def upload(content, filename='orders.csv'):
+    """Run the upload route on an in-memory CSV file"""
+    return asyncio.run(server.upload_file(UploadFile(io.BytesIO(content), filename=filename)))
+
+
+ORDERS_CSV = (
+    b"InvoiceNo,StockCode,Quantity,UnitPrice,InvoiceDate\n"
+    b"A1,P1,1,1.0,2010-12-01\n"
+    b"A1,P2,2,1.0,2010-12-01\n"
+    b"A2,P1,3,1.0,2010-12-02\n"
+    b"A3,P1,,1.0,2010-12-02\n"
+)
+
+
+def test_infer_date_format_month_first():
+    assert server.infer_date_format(['01/02/2010', '12/31/2010']) == '%m/%d/%Y'
+
+
+def test_infer_date_format_day_first():
+    assert server.infer_date_format(['01/02/2010', '13/02/2010']) == '%d/%m/%Y'
+
+
+def test_infer_date_format_without_candidates():
+    assert server.infer_date_format(['not a date']) is None
+    assert server.infer_date_format([]) is None
+
+
+def test_date_format_is_shared_across_batches():
+    batches = iter([
+        (order_batch([('A1', '01/02/2010'), ('A2', '03/02/2010')]), 0),
+        (order_batch([('B1', '01/02/2010'), ('B2', '13/02/2010')]), 0),
+    ])
+
+    progress = server.UploadProgress()
+    first, _, _ = server.process_next_batch(batches, progress)
+    second, _, _ = server.process_next_batch(batches, progress)
+
+    assert progress.date_format == '%m/%d/%Y'
+    assert first['order_date'].iloc[0] == second['order_date'].iloc[0] == pd.Timestamp('2010-01-02')
+    assert second['order_date'].iloc[1] == pd.Timestamp('2010-02-13')
+
+
+def test_dates_not_matching_the_upload_format_are_reparsed():
+    batches = iter([
+        (order_batch([('A1', '2010-12-01')]), 0),
+        (order_batch([('B1', '2010-12-01 08:26:00'), ('B2', '2010-12-02 09:00:00')]), 0),
+    ])
+
+    progress = server.UploadProgress()
+    server.process_next_batch(batches, progress)
+    second, _, errors = server.process_next_batch(batches, progress)
+
+    assert list(second['order_date']) == [pd.Timestamp('2010-12-01 08:26'), pd.Timestamp('2010-12-02 09:00')]
+    assert errors == []
+
+
+def test_unparseable_dates_are_reported():
+    batches = iter([(order_batch([('A1', '2010-12-01'), ('A2', 'not a date')]), 0)])
+
+    df, _, errors = server.process_next_batch(batches, server.UploadProgress())
+
+    assert list(df['order_id']) == ['A1']
+    assert errors == ["Removed 1 records with unparseable order dates"]
+
+
+def test_malformed_rows_are_skipped_and_counted():
+    data = (
+        b'InvoiceNo,StockCode,Quantity,UnitPrice\n'
+        b'A1,P1,1,1.0\n'
+        b'A2,P1,1\n'
+        b'A3,P1,1,1.0\n'
+    )
+    batches = server.read_csv_batches(io.BytesIO(data))
+
+    df, original_count, errors = server.process_next_batch(batches, server.UploadProgress())
+
+    assert list(df['order_id']) == ['A1', 'A3']
+    assert original_count == 3
+    assert "Skipped 1 malformed records" in errors
+
+
+def test_duplicates_across_batches_are_removed():
+    batches = iter([
+        (order_batch([('A1', '2010-12-01'), ('A2', '2010-12-01')]), 0),
+        (order_batch([('A2', '2010-12-01'), ('A3', '2010-12-01')]), 0),
+    ])
+    progress = server.UploadProgress()
+
+    server.process_next_batch(batches, progress)
+    second, _, errors = server.process_next_batch(batches, progress)
+
+    assert list(second['order_id']) == ['A3']
+    assert errors == ["Removed 1 duplicate records"]
+
+
+def test_summarize_errors_merges_batch_messages():
+    errors = [
+        "Removed 2 duplicate records",
+        "Missing required columns: ['quantity']",
+        "Removed 3 duplicate records",
+        "Skipped 1 malformed records",
+        "Missing required columns: ['quantity']",
+    ]
+
+    assert server.summarize_errors(errors) == [
+        "Removed 5 duplicate records",
+        "Missing required columns: ['quantity']",
+        "Skipped 1 malformed records",
+    ]
+
+
+def test_clean_dataframe_reports_rows_removed():
+    df = pd.DataFrame({
+        'order_id': ['A1', 'A1', 'A2', 'A3', 'A4'],
+        'product_id': ['P1', 'P1', 'P1', None, 'P1'],
+        'quantity': [1, 1, 2, 3, None],
+    })
+
+    cleaned, errors = server.clean_dataframe(df)
+
+    assert list(cleaned['order_id']) == ['A1', 'A2']
+    assert errors == [
+        "Removed 1 duplicate records",
+        "Removed 2 records with missing values",
+    ]
+
+
+def test_standardize_schema_normalizes_and_maps_columns():
+    df = pd.DataFrame({
+        'Invoice No': ['A1'],
+        'STOCK_CODE': ['P1'],
+        'Qty': ['2'],
+        'Unit Price': ['1.5'],
+        'Customer_ID': ['C1'],
+        'Gift Wrap': ['no'],
+    })
+
+    standardized, errors, _ = server.standardize_schema(df)
+
+    assert list(standardized.columns) == [
+        'order_id', 'product_id', 'quantity', 'unit_price', 'customer_id', 'giftwrap', 'total_price',
+    ]
+    assert standardized['total_price'].iloc[0] == 3.0
+    assert errors == []
+
+
+def test_standardize_schema_reports_missing_columns():
+    df = pd.DataFrame({'Invoice': ['A1'], 'SKU': ['P1']})
+
+    _, errors, _ = server.standardize_schema(df)
+
+    assert errors == ["Missing required columns: ['quantity', 'unit_price']"]
+
+
+def test_upload_counts_new_existing_and_failed_records(fake_db):
+    first = upload(ORDERS_CSV)
+    second = upload(ORDERS_CSV)
+
+    assert (first['records_processed'], first['records_existing'], first['records_failed']) == (3, 0, 1)
+    assert (second['records_processed'], second['records_existing'], second['records_failed']) == (0, 3, 1)
+    assert len(fake_db.ecommerce_data.documents) == 3
+
+    log = list(fake_db.processing_logs.documents.values())[-1]
+    assert (log['records_processed'], log['records_existing'], log['records_failed']) == (0, 3, 1)
+
+
+def test_partial_store_failure_logs_records_written(fake_db):
+    fake_db.ecommerce_data.fail_after = 2
+
+    with pytest.raises(HTTPException) as excinfo:
+        upload(ORDERS_CSV)
+
+    assert excinfo.value.status_code == 500
+    assert "(2 records were stored before the failure)" in excinfo.value.detail
+    log = list(fake_db.processing_logs.documents.values())[-1]
+    assert log['status'] == 'failed'
+    assert (log['records_processed'], log['records_existing'], log['records_failed']) == (2, 0, 2)
+
+
+def test_oversized_upload_is_rejected(fake_db, monkeypatch):
+    monkeypatch.setattr(server, 'MAX_UPLOAD_SIZE', len(ORDERS_CSV) - 1)
+
+    with pytest.raises(HTTPException) as excinfo:
+        upload(ORDERS_CSV)
+
+    assert excinfo.value.status_code == 413
+    assert fake_db.ecommerce_data.documents == {}
+    assert fake_db.processing_logs.documents == {}